@@ -1,45 +1,68 @@
 #!/usr/bin/env python
 
 import sys
-import toml
-import re
+import tomllib
+import tomli_w
 import os
-import json
-from os.path import dirname, basename, join
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from os.path import dirname, join
 
-extensions = {}
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+extensions = defaultdict(list)
 cores = {}
 consoles = {}
-folders = {}
+folders = defaultdict(list)
+
+BLACKLIST_EXTENSIONS = frozenset(["", "bin", "rom", "m3u", "cue", "iso", "img", "chd", "ccd", "zip", "7z", "dsk", "cas", "mx1", "mx2", "miyoocmd", "bs", "dmg", "fig", "tap"])
 
-BLACKLIST_EXTENSIONS = ["", "bin", "rom", "m3u", "cue", "iso", "img", "chd", "ccd", "zip", "7z", "dsk", "cas", "mx1", "mx2", "miyoocmd", "bs", "dmg", "fig", "tap"]
+CORE_PREFIX = b".retroarch/cores/"
+CORE_SUFFIX = b"_libretro.so"
+
+CANONICAL_CONSOLE_NAME = {
+    "Nintendo - GB": "Nintendo - Game Boy",
+    "Nintendo - GBC": "Nintendo - Game Boy Color",
+    "Nintendo - GBA": "Nintendo - Game Boy Advance",
+    "Nintendo - Super Game Boy": "Nintendo - Game Boy Color",
+    ".Java - J2ME": "Java - J2ME",
+}
 
 def canonicalize_console_name(name):
-    CANONICAL_CONSOLE_NAME = {
-        "Nintendo - GB": "Nintendo - Game Boy",
-        "Nintendo - GBC": "Nintendo - Game Boy Color",
-        "Nintendo - GBA": "Nintendo - Game Boy Advance",
-        "Nintendo - Super Game Boy": "Nintendo - Game Boy Color",
-        ".Java - J2ME": "Java - J2ME",
-    }
-    return CANONICAL_CONSOLE_NAME[name] if name in CANONICAL_CONSOLE_NAME else name
+    return CANONICAL_CONSOLE_NAME.get(name, name)
 
 def extract_file(path):
-    with open(path, 'r') as f:
-        data = json.load(f)
+    # Packages are laid out as <name>/<type>/<folder>/config.json
+    parts = path.rsplit(os.sep, 4)
+    if len(parts) < 4:
+        return None
 
-    launch_path = join(dirname(path), "launch.sh")
-    with open(launch_path, 'r') as f:
-        launch = f.read().strip()
-    match = re.search(".retroarch/cores/(.+)_libretro.so", launch)
-    if match is None:
-        core = None
-    else:
-        core = match.group(1)
+    with open(path, 'rb') as f:
+        data = loads(f.read())
 
-    name = basename(dirname(dirname(dirname(path))))
+    launch_path = join(dirname(path), "launch.sh")
+    with open(launch_path, 'rb') as f:
+        launch = f.read()
+    core = None
+    start = launch.find(CORE_PREFIX)
+    while start >= 0:
+        # The first core path wins, and it must sit on a single line
+        core_start = start + len(CORE_PREFIX)
+        line_end = launch.find(b"\n", core_start)
+        if line_end < 0:
+            line_end = len(launch)
+        end = launch.rfind(CORE_SUFFIX, core_start + 1, line_end)
+        if end >= 0:
+            core = launch[core_start:end].decode()
+            break
+        start = launch.find(CORE_PREFIX, start + 1)
+
+    name = parts[-4]
     console = canonicalize_console_name(name.rsplit("(", 1)[0].strip())
-    folder = basename(dirname(path))
+    folder = parts[-2]
     extensions = [ext for ext in data["extlist"].split("|") if ext not in BLACKLIST_EXTENSIONS]
 
     return {
@@ -50,28 +73,38 @@ def extract_file(path):
         "extensions": extensions,
     }
 
+def iter_configs(root):
+    # Like os.walk, skip directories that are missing or unreadable
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_configs(entry.path)
+            elif entry.name == "config.json" and entry.is_file():
+                yield entry.path
+
 def extract_directory(directory, whitelist = None):
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file == "config.json":
-                path = os.path.join(root, file)
-                console = extract_file(path)
-                if whitelist is None or console['name'] in whitelist:
-                    print(console['console'])
-                    if console['console'] in consoles:
-                        if console['core'] is not None:
-                            consoles[console['console']]['cores'].append(console['core'])
-                        if console['folder'] not in consoles[console['console']]['folders']:
-                            consoles[console['console']]['folders'].append(console['folder'])
-                        for ext in console['extensions']:
-                            if ext not in consoles[console['console']]['extensions']:
-                                consoles[console['console']]['extensions'].append(ext)
-                    else:
-                        consoles[console['console']] = {
-                            "cores": [console['core']],
-                            "folders": [console['folder']],
-                            "extensions": console['extensions'],
-                        }
+    paths = list(iter_configs(directory))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(extract_file, paths))
+
+    for console in results:
+        if console is None:
+            continue
+        if whitelist is None or console['name'] in whitelist:
+            print(console['console'])
+            entry = consoles.setdefault(console['console'], {
+                "cores": {},
+                "folders": set(),
+                "extensions": set(),
+            })
+            if console['core'] is not None:
+                entry['cores'].setdefault(console['core'])
+            entry['folders'].add(console['folder'])
+            entry['extensions'].update(console['extensions'])
 
 def extract():
     extract_directory("../../Onion/static/packages/Emu")
@@ -86,22 +119,32 @@ def extract():
         "NEC - PC-FX (Mednafen PC-FX)",
     ])
 
+    # Cores keep discovery order, the first is the default
+    for console in consoles.values():
+        console["cores"] = list(console["cores"])
+        console["folders"] = sorted(console["folders"])
+        console["extensions"] = sorted(console["extensions"])
+
+    output = tomli_w.dumps({name: consoles[name] for name in sorted(consoles)})
+    if os.path.exists("consoles.toml"):
+        with open("consoles.toml", "r") as f:
+            if f.read() == output:
+                print("No change to consoles.toml")
+                return
+
     with open("consoles.toml", "w") as f:
-        f.write(toml.dumps(consoles))
-    
+        f.write(output)
+
     print("Written to consoles.toml")
 
 def check():
-    with open("consoles.toml", "r") as f:
-        consoles = toml.loads(f.read())
+    with open("consoles.toml", "rb") as f:
+        consoles = tomllib.load(f)
 
     # Check that extensions are not duplicated
     for (name, console) in consoles.items():
         for extension in console['extensions']:
-            if extension in extensions:
-                extensions[extension].append(name)
-            else:
-                extensions[extension] = [name]
+            extensions[extension].append(name)
     for (extension, names) in extensions.items():
         if len(names) > 1:
             print("Duplicate extension: " + extension + "\n- " + "\n- ".join(names) + "\n")
@@ -109,10 +152,7 @@ def check():
     # Check that folders are not duplicated
     for (name, console) in consoles.items():
         for folder in console['folders']:
-            if folder in folders:
-                folders[folder].append(name)
-            else:
-                folders[folder] = [name]
+            folders[folder].append(name)
     for (folder, names) in folders.items():
         if len(names) > 1:
             print("Duplicate folder: " + folder + "\n" + "\n- ".join(names) + "\n")
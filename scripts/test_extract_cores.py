@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from extract_cores import extract_file, iter_configs
+
+
+class ExtractFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.package = os.path.join(self.tmp.name, "Nintendo - GB (Gambatte)", "Emu", "GB")
+        os.makedirs(self.package)
+        with open(os.path.join(self.package, "config.json"), "w") as f:
+            f.write('{"label": "GB", "extlist": "gb|zip"}')
+
+    def extract(self, launch):
+        with open(os.path.join(self.package, "launch.sh"), "w") as f:
+            f.write(launch)
+        return extract_file(os.path.join(self.package, "config.json"))
+
+    def test_core(self):
+        console = self.extract('-L .retroarch/cores/gambatte_libretro.so "$1"\n')
+        self.assertEqual(console["core"], "gambatte")
+        self.assertEqual(console["name"], "Nintendo - GB (Gambatte)")
+        self.assertEqual(console["console"], "Nintendo - Game Boy")
+        self.assertEqual(console["folder"], "GB")
+        self.assertEqual(console["extensions"], ["gb"])
+
+    def test_core_ignores_later_lines(self):
+        console = self.extract('-L .retroarch/cores/gambatte_libretro.so "$1"\n# alt: mgba_libretro.so\n')
+        self.assertEqual(console["core"], "gambatte")
+
+    def test_core_ignores_variable_core(self):
+        console = self.extract('-L .retroarch/cores/gambatte_libretro.so "$1"\n-L ${CORE}_libretro.so\n')
+        self.assertEqual(console["core"], "gambatte")
+
+    def test_core_takes_first_line(self):
+        console = self.extract(
+            'if [ -f "$2" ]; then\n'
+            '    retroarch -L .retroarch/cores/gambatte_libretro.so "$1"\n'
+            'else\n'
+            '    retroarch -L .retroarch/cores/mgba_libretro.so "$1"\n'
+            'fi\n'
+        )
+        self.assertEqual(console["core"], "gambatte")
+
+    def test_empty_core(self):
+        console = self.extract('-L .retroarch/cores/_libretro.so "$1"\n')
+        self.assertIsNone(console["core"])
+
+    def test_shallow_path(self):
+        self.assertIsNone(extract_file(os.path.join("b", "c", "config.json")))
+
+        self.extract('-L .retroarch/cores/gambatte_libretro.so "$1"\n')
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        console = extract_file(os.path.join("Nintendo - GB (Gambatte)", "Emu", "GB", "config.json"))
+        self.assertEqual(console["name"], "Nintendo - GB (Gambatte)")
+        self.assertEqual(console["folder"], "GB")
+
+    def test_no_core(self):
+        console = self.extract('./gambatte "$1"\n')
+        self.assertIsNone(console["core"])
+
+
+class IterConfigsTest(unittest.TestCase):
+    def test_missing_root(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(list(iter_configs(os.path.join(tmp, "missing"))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()